@@ -1,5 +1,7 @@
+import numpy as np
 import pandas as pd
 import re
+import sys
 from pathlib import Path
 import logging
 
@@ -9,55 +11,66 @@ logger = logging.getLogger(__name__)
 INPUT_FILE = Path(__file__).parent.parent / "data" / "raw" / "shl_catalog.csv"
 OUTPUT_FILE = Path(__file__).parent.parent / "data" / "processed" / "shl_catalog_enriched.csv"
 
+WHITESPACE_RE = re.compile(r"\s+")
+DIGITS_RE = re.compile(r"(\d+)")
 
-def normalize_whitespace(text):
-    if pd.isna(text):
-        return ""
-    return re.sub(r"\s+", " ", str(text)).strip()
 
+def normalize_whitespace(series):
+    return (
+        series.fillna("")
+        .astype(str)
+        .str.replace(WHITESPACE_RE, " ", regex=True)
+        .str.strip()
+    )
 
-def extract_duration_minutes(text):
-    if pd.isna(text):
-        return None
-    m = re.search(r"(\d+)", str(text))
-    return int(m.group(1)) if m else None
 
+def extract_duration_minutes(series):
+    return pd.to_numeric(series.astype(str).str.extract(DIGITS_RE, expand=False))
 
-def normalize_boolean(v):
-    if pd.isna(v):
-        return "Unknown"
-    v = str(v).lower()
-    if v == "yes":
-        return "Yes"
-    if v == "no":
-        return "No"
-    return "Unknown"
 
+def normalize_boolean(series):
+    v = series.astype(str).str.lower().str.strip()
+    return pd.Series(
+        np.select([v.eq("yes"), v.eq("no")], ["Yes", "No"], default="Unknown"),
+        index=series.index,
+    )
 
-def clean():
-    df = pd.read_csv(INPUT_FILE)
+
+def clean(force=False):
+    # The output is also enriched in place downstream, so a rebuild would
+    # discard that work; only rebuild when the raw scrape is newer
+    if (
+        not force
+        and OUTPUT_FILE.exists()
+        and OUTPUT_FILE.stat().st_mtime > INPUT_FILE.stat().st_mtime
+    ):
+        logger.info(f"{OUTPUT_FILE} is up to date, skipping (use --force to rebuild)")
+        return
+
+    # Every raw column is text; skip per-column type inference
+    df = pd.read_csv(INPUT_FILE, dtype=str)
     logger.info(f"Loaded {len(df)} rows")
 
     if "name" in df:
-        df["name"] = df["name"].apply(normalize_whitespace)
+        df["name"] = normalize_whitespace(df["name"])
+        # Dedupe up front so the remaining column passes only see unique rows
+        df = df.drop_duplicates(subset=["name"]).reset_index(drop=True)
 
     if "description" in df:
-        df["description"] = df["description"].apply(normalize_whitespace)
+        df["description"] = normalize_whitespace(df["description"])
 
     if "test_type" in df:
-        df["test_type"] = df["test_type"].apply(normalize_whitespace)
+        df["test_type"] = normalize_whitespace(df["test_type"])
 
     if "duration" in df:
-        df["duration_minutes"] = df["duration"].apply(extract_duration_minutes)
+        df["duration_minutes"] = extract_duration_minutes(df["duration"])
         df.drop(columns=["duration"], inplace=True)
 
     if "remote_testing" in df:
-        df["remote_testing"] = df["remote_testing"].apply(normalize_boolean)
+        df["remote_testing"] = normalize_boolean(df["remote_testing"])
 
     if "adaptive_irt" in df:
-        df["adaptive_irt"] = df["adaptive_irt"].apply(normalize_boolean)
-
-    df = df.drop_duplicates(subset=["name"]).reset_index(drop=True)
+        df["adaptive_irt"] = normalize_boolean(df["adaptive_irt"])
 
     OUTPUT_FILE.parent.mkdir(parents=True, exist_ok=True)
     df.to_csv(OUTPUT_FILE, index=False)
@@ -66,4 +79,4 @@ def clean():
 
 
 if __name__ == "__main__":
-    clean()
+    clean(force="--force" in sys.argv)
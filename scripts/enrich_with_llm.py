@@ -4,10 +4,12 @@ Enrich SHL Catalog with LLM-Generated Metadata (GROQ — ULTRA SAFE)
 Uses Groq (llama-3.1-8b-instant) to enrich assessment descriptions.
 
 Safety-first design:
-- Small batches (3 rows)
-- Long delays
-- Periodic cooldowns
-- Resume-safe CSV caching
+- Batches of 12 rows behind one compact prompt
+- Token usage tracked over a rolling 60s window
+- Request starts paced under the RPM budget
+- Bounded number of in-flight requests
+- Resume-safe JSONL cache keyed by description hash (single CSV write at the end)
+- Duplicate descriptions sent to the model once
 - No manual tuning required
 
 Groq Free Tier (practical):
@@ -17,8 +19,11 @@ Groq Free Tier (practical):
 
 import os
 import json
+import hashlib
+import asyncio
 import time
 import logging
+from collections import deque
 import pandas as pd
 from pathlib import Path
 from dotenv import load_dotenv
@@ -26,7 +31,7 @@ from dotenv import load_dotenv
 # ---------------- DEPENDENCIES ---------------- #
 
 try:
-    from groq import Groq
+    from groq import AsyncGroq
 except ImportError:
     raise RuntimeError("Install groq first: pip install groq")
 
@@ -44,6 +49,7 @@ logger = logging.getLogger(__name__)
 
 INPUT_FILE = Path(__file__).parent.parent / "data" / "processed" / "shl_catalog_enriched.csv"
 OUTPUT_FILE = INPUT_FILE  # in-place update
+CACHE_FILE = OUTPUT_FILE.with_suffix(".cache.jsonl")  # enrichment by content hash
 
 # ---------------- GROQ CONFIG ---------------- #
 
@@ -55,10 +61,22 @@ MODEL_NAME = "llama-3.1-8b-instant"
 
 # ---------------- SAFETY CONTROLS ---------------- #
 
-BATCH_SIZE = 3              # safest size for TPM
-REQUEST_DELAY = 4.0         # seconds between requests
-COOLDOWN_EVERY = 10          # batches
-COOLDOWN_SECONDS = 30.0     # pause to reset minute window
+BATCH_SIZE = 12             # amortizes the prompt over more rows
+REQUESTS_PER_MINUTE = 28    # just under the ~30 RPM limit
+TOKENS_PER_MINUTE = 5500    # just under the ~6k TPM limit
+MAX_CONCURRENCY = 4         # requests in flight at once
+DESCRIPTION_CHARS = 500     # description prefix sent to the model
+OUTPUT_TOKENS_PER_ITEM = 150  # reply size estimate for TPM budgeting
+
+# ---------------- ENRICHMENT COLUMNS ---------------- #
+
+ENRICHMENT_COLUMNS = [
+    "skills_covered", "skill_domains", "assessment_category",
+    "job_roles", "seniority_levels", "assessment_focus", "keywords"
+]
+LIST_COLUMNS = [
+    "skills_covered", "skill_domains", "job_roles", "seniority_levels", "keywords"
+]
 
 # ---------------- PROMPTS ---------------- #
 
@@ -71,28 +89,10 @@ Rules:
 - Keep output compact
 """
 
-USER_PROMPT_TEMPLATE = """
-You will be given a list of assessments.
-For EACH assessment, extract metadata.
-
-Return STRICT JSON ONLY as a list, in the SAME ORDER.
-
-Each item MUST be exactly:
-
-{{
-  "skills_covered": [],
-  "skill_domains": [],
-  "assessment_category": "",
-  "job_roles": [],
-  "seniority_levels": [],
-  "assessment_focus": "",
-  "keywords": []
-}}
-
-Constraints:
-- assessment_category ∈ ["Technical", "Behavioral", "Cognitive", "Mixed"]
-- Max 10 skills, 5 domains, 5 roles, 10 keywords
-- If unclear → empty lists or empty string
+USER_PROMPT_TEMPLATE = """Return JSON {{"items": [...]}} with one object per assessment, in the SAME ORDER.
+Keys: skills_covered[], skill_domains[], assessment_category, job_roles[], seniority_levels[], assessment_focus, keywords[]
+- assessment_category ∈ Technical|Behavioral|Cognitive|Mixed
+- Max 10 skills, 5 domains, 5 roles, 10 keywords; if unclear → [] or ""
 - DO NOT invent skills, tools, or roles
 
 Assessments:
@@ -101,13 +101,88 @@ Assessments:
 
 # ---------------- UTILITIES ---------------- #
 
-def is_row_enriched(row):
-    return (
-        isinstance(row.get("skills_covered"), str)
-        and row["skills_covered"].strip()
-        and isinstance(row.get("assessment_category"), str)
-        and row["assessment_category"].strip()
-    )
+def enriched_mask(df):
+    skills = df["skills_covered"].fillna("").astype(str).str.strip()
+    category = df["assessment_category"].fillna("").astype(str).str.strip()
+    return skills.ne("") & category.ne("")
+
+def content_key(name, description):
+    """blake2b-128 of the description; falls back to the name when it is empty."""
+    if isinstance(description, str) and description.strip():
+        text = description
+    else:
+        text = f"name:{name}"
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+def load_cache():
+    cache = {}
+    if not CACHE_FILE.exists():
+        return cache
+
+    with open(CACHE_FILE, encoding="utf-8") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # torn last line from a crash mid-write
+            cache[rec.pop("key")] = rec
+    return cache
+
+def apply_cache(df, keys, cache):
+    """Fill pending rows whose content key is cached. Returns rows filled."""
+    idx = df.index[keys.isin(cache.keys()) & ~enriched_mask(df)]
+    if len(idx):
+        cached = pd.DataFrame([cache[k] for k in keys[idx]], index=idx)
+        df.loc[idx, ENRICHMENT_COLUMNS] = cached[ENRICHMENT_COLUMNS]
+    return len(idx)
+
+def append_cache(df, keys, cache, idxs):
+    rows = df.loc[idxs, ENRICHMENT_COLUMNS].assign(key=keys[idxs])
+    with open(CACHE_FILE, "a", encoding="utf-8") as f:
+        for rec in rows.to_dict("records"):
+            f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+            cache[rec.pop("key")] = rec
+
+class RateLimiter:
+    """Spaces request starts evenly so at most `per_minute` begin each minute."""
+
+    def __init__(self, per_minute):
+        self.interval = 60.0 / per_minute
+        self.next_slot = 0.0
+        self.lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self.lock:
+            now = time.monotonic()
+            delay = self.next_slot - now
+            self.next_slot = max(now, self.next_slot) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+class TokenBudget:
+    """Rolling 60s window of tokens spent; waits while a request would exceed it."""
+
+    def __init__(self, per_minute):
+        self.per_minute = per_minute
+        self.window = deque()  # [timestamp, tokens] entries
+        self.lock = asyncio.Lock()
+
+    def spent(self, now):
+        while self.window and now - self.window[0][0] >= 60.0:
+            self.window.popleft()
+        return sum(tokens for _, tokens in self.window)
+
+    async def acquire(self, tokens):
+        """Reserve `tokens`; returns the window entry so actual usage can be recorded."""
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                spent = self.spent(now)
+                if not spent or spent + tokens <= self.per_minute:
+                    entry = [now, tokens]
+                    self.window.append(entry)
+                    return entry
+                await asyncio.sleep(60.0 - (now - self.window[0][0]))
 
 def chunk_list(lst, size):
     for i in range(0, len(lst), size):
@@ -115,96 +190,117 @@ def chunk_list(lst, size):
 
 # ---------------- MAIN PIPELINE ---------------- #
 
-def enrich_catalog_data():
-    logger.info("=" * 70)
-    logger.info("SHL Catalog Enrichment — GROQ (SAFE + COMPLETE)")
-    logger.info("=" * 70)
-
-    if not INPUT_FILE.exists():
-        logger.error(f"File not found: {INPUT_FILE}")
-        return
-
-    df = pd.read_csv(INPUT_FILE)
-    logger.info(f"Loaded {len(df)} rows")
-
-    # Ensure columns exist
-    new_cols = [
-        "skills_covered", "skill_domains", "assessment_category",
-        "job_roles", "seniority_levels", "assessment_focus", "keywords"
-    ]
-    for c in new_cols:
-        if c not in df.columns:
-            df[c] = ""
-
-    client = Groq(api_key=GROQ_API_KEY)
-
-    pending_indices = [
-        i for i, row in df.iterrows()
-        if not is_row_enriched(row)
-    ]
-
-    logger.info(f"Rows pending enrichment: {len(pending_indices)}")
-
-    batches_done = 0
-
-    for batch_idxs in chunk_list(pending_indices, BATCH_SIZE):
+async def process_batch(client, limiter, budget, semaphore, df, keys, cache, batch_no, batch_idxs):
+    batch = df.loc[batch_idxs, ["name", "description"]]
+    descriptions = batch["description"].fillna("").astype(str).str.slice(0, DESCRIPTION_CHARS)
+    payload = batch.assign(description=descriptions).to_dict("records")
 
-        payload = []
-        for idx in batch_idxs:
-            payload.append({
-                "name": df.at[idx, "name"],
-                "description": df.at[idx, "description"]
-            })
+    prompt = USER_PROMPT_TEMPLATE.format(
+        items=json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+    )
 
-        prompt = USER_PROMPT_TEMPLATE.format(
-            items=json.dumps(payload, ensure_ascii=False)
+    async with semaphore:
+        await limiter.wait()
+        usage = await budget.acquire(
+            (len(SYSTEM_PROMPT) + len(prompt)) // 4 + len(batch_idxs) * OUTPUT_TOKENS_PER_ITEM
         )
-
-        logger.info(f"Processing batch {batches_done + 1} ({len(batch_idxs)} rows)")
+        logger.info(f"Processing batch {batch_no} ({len(batch_idxs)} rows)")
 
         try:
-            response = client.chat.completions.create(
+            response = await client.chat.completions.create(
                 model=MODEL_NAME,
                 messages=[
                     {"role": "system", "content": SYSTEM_PROMPT},
                     {"role": "user", "content": prompt}
                 ],
-                temperature=0
+                temperature=0,
+                response_format={"type": "json_object"}
             )
+            if response.usage:
+                usage[1] = response.usage.total_tokens
 
             text = response.choices[0].message.content.strip()
-            data = json.loads(text)
+            data = json.loads(text)["items"]
 
             if len(data) != len(batch_idxs):
                 raise ValueError("Response length mismatch")
 
-            for idx, meta in zip(batch_idxs, data):
-                df.at[idx, "skills_covered"] = json.dumps(meta.get("skills_covered", []))
-                df.at[idx, "skill_domains"] = json.dumps(meta.get("skill_domains", []))
-                df.at[idx, "assessment_category"] = meta.get("assessment_category", "")
-                df.at[idx, "job_roles"] = json.dumps(meta.get("job_roles", []))
-                df.at[idx, "seniority_levels"] = json.dumps(meta.get("seniority_levels", []))
-                df.at[idx, "assessment_focus"] = meta.get("assessment_focus", "")
-                df.at[idx, "keywords"] = json.dumps(meta.get("keywords", []))
+            for col in ENRICHMENT_COLUMNS:
+                if col in LIST_COLUMNS:
+                    values = [json.dumps(meta.get(col, [])) for meta in data]
+                else:
+                    values = [meta.get(col, "") for meta in data]
+                df.loc[batch_idxs, col] = values
 
-            df.to_csv(OUTPUT_FILE, index=False, encoding="utf-8")
-            logger.info("✅ Batch saved successfully")
+            append_cache(df, keys, cache, batch_idxs)
+            logger.info(f"✅ Batch {batch_no} cached")
+            return True
 
         except Exception as e:
-            logger.error(f"❌ Batch failed: {e}")
+            logger.error(f"❌ Batch {batch_no} failed: {e}")
+            return False
+
+async def run_batches(df, keys, cache, pending_indices):
+    limiter = RateLimiter(REQUESTS_PER_MINUTE)
+    budget = TokenBudget(TOKENS_PER_MINUTE)
+    semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
+
+    async with AsyncGroq(api_key=GROQ_API_KEY) as client:
+        return await asyncio.gather(*(
+            process_batch(client, limiter, budget, semaphore, df, keys, cache, batch_no, batch_idxs)
+            for batch_no, batch_idxs in enumerate(chunk_list(pending_indices, BATCH_SIZE), 1)
+        ))
+
+def enrich_catalog_data():
+    logger.info("=" * 70)
+    logger.info("SHL Catalog Enrichment — GROQ (SAFE + COMPLETE)")
+    logger.info("=" * 70)
+
+    if not INPUT_FILE.exists():
+        logger.error(f"File not found: {INPUT_FILE}")
+        return
+
+    # Typed read: all-empty enrichment columns would otherwise load as float64
+    df = pd.read_csv(INPUT_FILE, dtype={c: str for c in ENRICHMENT_COLUMNS})
+    logger.info(f"Loaded {len(df)} rows")
+
+    # Ensure columns exist
+    for c in ENRICHMENT_COLUMNS:
+        if c not in df.columns:
+            df[c] = ""
+
+    keys = pd.Series(
+        [content_key(n, d) for n, d in zip(df["name"], df["description"])],
+        index=df.index,
+    )
+    cache = load_cache()
+
+    restored = apply_cache(df, keys, cache)
+    if restored:
+        logger.info(f"Restored {restored} rows from cache")
+
+    # One representative row per distinct description
+    pending_indices = keys[~enriched_mask(df)].drop_duplicates().index.to_numpy()
+
+    logger.info(f"Rows pending enrichment: {len(pending_indices)}")
+
+    results = asyncio.run(run_batches(df, keys, cache, pending_indices))
+    batches_done = len(results)
 
-        batches_done += 1
+    # Copy results to rows sharing a description, then seed the cache with
+    # rows enriched before it existed
+    apply_cache(df, keys, cache)
+    uncached = keys[enriched_mask(df) & ~keys.isin(cache.keys())].drop_duplicates().index
+    if len(uncached):
+        append_cache(df, keys, cache, uncached)
 
-        # Cooldown every N batches
-        if batches_done % COOLDOWN_EVERY == 0:
-            logger.info(f"⏸ Cooling down for {COOLDOWN_SECONDS}s")
-            time.sleep(COOLDOWN_SECONDS)
-        else:
-            time.sleep(REQUEST_DELAY)
+    df.to_csv(OUTPUT_FILE, index=False, encoding="utf-8")
+    logger.info(f"Saved {len(df)} rows to {OUTPUT_FILE}")
 
     logger.info("=" * 70)
     logger.info("DONE — All possible rows processed")
     logger.info(f"Batches processed: {batches_done}")
+    logger.info(f"Batches failed: {results.count(False)}")
     logger.info("=" * 70)
 
 # ---------------- ENTRY ---------------- #
@@ -3,6 +3,9 @@ from bs4 import BeautifulSoup
 import pandas as pd
 import time
 import re
+import os
+import json
+from concurrent.futures import ThreadPoolExecutor
 
 BASE_URL = "https://www.shl.com/solutions/products/product-catalog/"
 HEADERS = {
@@ -11,7 +14,11 @@ HEADERS = {
 
 LIST_DELAY = 1.0
 DETAIL_DELAY = 1.5
+DETAIL_WORKERS = 4  # concurrent detail-page fetches, each still paced by DETAIL_DELAY
 MAX_RETRIES = 3
+CHECKPOINT_FILE = "data/raw/shl_catalog.checkpoint.jsonl"  # one line per fetched detail page
+
+DIGITS_RE = re.compile(r"(\d+)")
 
 
 # ---------------- SESSION ---------------- #
@@ -30,37 +37,40 @@ def fetch_assessment_details(assessment):
             r = session.get(url, timeout=20)
             r.raise_for_status()
 
-            soup = BeautifulSoup(r.content, "html.parser")
-            description = ""
+            soup = BeautifulSoup(r.content, "lxml")
+            description = None
             duration = ""
 
-            product_module = soup.find(
-                "div", class_=lambda x: x and "product-catalogue" in x
-            )
+            product_module = soup.select_one('div[class*="product-catalogue"]')
 
             if product_module:
-                rows = product_module.find_all(
-                    "div",
-                    class_=lambda x: x and "product-catalogue-training-calendar__row" in x
+                rows = product_module.select(
+                    'div[class*="product-catalogue-training-calendar__row"]'
                 )
 
-                for row in rows:
+                # Scan from the bottom so the last matching row wins, then
+                # stop once both fields are settled
+                for row in reversed(rows):
                     h4 = row.find("h4")
                     p = row.find("p")
                     if not h4 or not p:
                         continue
 
                     title = h4.text.lower()
-                    text = p.text.strip()
 
                     if "description" in title:
-                        description = text
+                        if description is None:
+                            description = p.text.strip()
                     elif "assessment length" in title or "duration" in title:
-                        m = re.search(r'(\d+)', text)
-                        if m:
-                            duration = f"{m.group(1)} minutes"
+                        if not duration:
+                            m = DIGITS_RE.search(p.text)
+                            if m:
+                                duration = f"{m.group(1)} minutes"
+
+                    if description is not None and duration:
+                        break
 
-            assessment["description"] = description
+            assessment["description"] = description or ""
             assessment["duration"] = duration
             break
 
@@ -117,7 +127,7 @@ def scrape_pages(type_param=1, max_pages=32):
             if r.status_code != 200:
                 break
 
-            soup = BeautifulSoup(r.content, "html.parser")
+            soup = BeautifulSoup(r.content, "lxml")
             tables = soup.find_all("table")
             if not tables:
                 break
@@ -136,16 +146,56 @@ def scrape_pages(type_param=1, max_pages=32):
     return all_assessments
 
 
+# ---------------- CHECKPOINT ---------------- #
+
+def load_checkpoint():
+    done = {}
+    if not os.path.exists(CHECKPOINT_FILE):
+        return done
+
+    with open(CHECKPOINT_FILE, encoding="utf-8") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # torn last line from a crash mid-write
+            done[rec["url"]] = rec
+    return done
+
+
 # ---------------- MAIN ---------------- #
 
 def scrape():
+    # Fetched details are checkpointed to CHECKPOINT_FILE and reused on the
+    # next call; save_to_csv() removes it once the results are saved.
     assessments = scrape_pages()
     print(f"Found {len(assessments)} assessments. Fetching details...")
 
-    for i, a in enumerate(assessments, 1):
-        fetch_assessment_details(a)
-        if i % 10 == 0:
-            print(f"Progress: {i}/{len(assessments)}")
+    done = load_checkpoint()
+    pending = []
+    for a in assessments:
+        rec = done.get(a["url"])
+        if rec:
+            a["description"] = rec["description"]
+            a["duration"] = rec["duration"]
+        else:
+            pending.append(a)
+
+    if done:
+        print(f"Resuming: {len(assessments) - len(pending)} already fetched")
+
+    with open(CHECKPOINT_FILE, "a", encoding="utf-8", buffering=1) as checkpoint, \
+            ThreadPoolExecutor(max_workers=DETAIL_WORKERS) as pool:
+        for i, a in enumerate(pool.map(fetch_assessment_details, pending), 1):
+            # Pages that came back empty are retried on the next run
+            if a["description"] or a["duration"]:
+                checkpoint.write(json.dumps({
+                    "url": a["url"],
+                    "description": a["description"],
+                    "duration": a["duration"],
+                }, ensure_ascii=False) + "\n")
+            if i % 10 == 0:
+                print(f"Progress: {i}/{len(pending)}")
 
     return pd.DataFrame(assessments)
 
@@ -154,6 +204,10 @@ def save_to_csv(df, filename="data/raw/shl_catalog.csv"):
     df.to_csv(filename, index=False)
     print(f"Saved {len(df)} rows to {filename}")
 
+    # Details are now persisted; the next scrape starts fresh
+    if os.path.exists(CHECKPOINT_FILE):
+        os.remove(CHECKPOINT_FILE)
+
 
 if __name__ == "__main__":
     df = scrape()